@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+'''Check that the mask engine stops allocating once the frame size is set.
+
+Usage: python3 benchmarks/allocation_check.py [image] [frames]
+'''
+import os
+import sys
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from engine import MaskEngine, MaskParams  # noqa: E402
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'images/sample.jpg'
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    frame = cv2.imread(path)
+    params = MaskParams((85, 91, 121), (179, 255, 238), blur=True,
+                        erode=True, erode_i=2, dilate=True, invert=True,
+                        show=True)
+    engine = MaskEngine()
+    engine.process(frame, params)
+    warm = engine.pool.allocations
+    for _ in range(frames):
+        engine.process(frame, params)
+    extra = engine.pool.allocations - warm
+    print('Warm-up allocations: {}'.format(warm))
+    print('Pool size: {:.1f} MB'.format(engine.pool.nbytes() / 2 ** 20))
+    print('Allocations over {} frames: {}'.format(frames, extra))
+    return 1 if extra else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
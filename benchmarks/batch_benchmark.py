@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+'''Compare MaskDetector.getMasks on a frame stack with a getMask loop.
+
+Usage: python3 benchmarks/batch_benchmark.py [image] [frames] [config]
+'''
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'example'))
+from detector import MaskDetector  # noqa: E402
+
+
+def timed(function, runs=3):
+    function()
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'images/sample.jpg'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    config = sys.argv[3] if len(sys.argv) > 3 else 'config.csv'
+    image = cv2.imread(path)
+    # Shifted copies, so no frame repeats the previous one.
+    frames = np.stack([np.roll(image, 7 * index, axis=1)
+                       for index in range(count)])
+    detector = MaskDetector(config)
+    masks = np.empty(frames.shape[:3], np.uint8)
+
+    def loop():
+        for index, frame in enumerate(frames):
+            masks[index] = detector.getMask(frame)
+
+    loop()
+    reference = masks.copy()
+    print('Frames: {} x {}x{}'.format(count, image.shape[1], image.shape[0]))
+    seconds = timed(loop)
+    print('getMask loop:        {:8.2f} ms/frame'.format(
+        seconds / count * 1000))
+    workers = [1, 2, os.cpu_count() or 1]
+    for worker_count in sorted(set(workers)):
+        detector.getMasks(frames, masks, worker_count)
+        assert np.array_equal(masks, reference)
+        seconds = timed(lambda: detector.getMasks(frames, masks,
+                                                  worker_count))
+        print('getMasks, {:2d} thread: {:8.2f} ms/frame'.format(
+            worker_count, seconds / count * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+'''Compare the lookup-table threshold against cvtColor + inRange.
+
+Usage: python3 benchmarks/lut_benchmark.py [image] [long edge] [runs]
+'''
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from engine.lut import MaskLUT  # noqa: E402
+
+
+def timed(function, runs):
+    function()
+    start = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'images/sample.jpg'
+    long_edge = int(sys.argv[2]) if len(sys.argv) > 2 else 1920
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    frame = cv2.imread(path)
+    scale = long_edge / max(frame.shape[:2])
+    frame = cv2.resize(frame, None, fx=scale, fy=scale)
+    lower_range, upper_range = (85, 91, 121), (179, 255, 238)
+
+    lut = MaskLUT()
+    start = time.perf_counter()
+    lut.update(lower_range, upper_range, wait=True)
+    print('Table build:  {:8.2f} ms (per range change)'.format(
+        (time.perf_counter() - start) * 1000))
+
+    dst = np.empty(frame.shape[:2], np.uint8)
+
+    def opencv():
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        return cv2.inRange(hsv, lower_range, upper_range)
+
+    def table():
+        return lut.mask(frame, lower_range, upper_range, dst)
+
+    assert np.array_equal(opencv(), table())
+    print('Frame size:   {}x{}'.format(frame.shape[1], frame.shape[0]))
+    print('cvtColor+inRange: {:8.2f} ms'.format(timed(opencv, runs)))
+    print('Lookup table:     {:8.2f} ms'.format(timed(table, runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+'''Compare TrackingDetector.track with full-frame detection on footage.
+
+Usage: python3 benchmarks/tracking_benchmark.py [video] [config]
+
+Without a video, a clip of a blue disc moving over grey noise, hidden now
+and then, is generated.
+'''
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'example'))
+from detector import ColorDetertor, TrackingDetector  # noqa: E402
+
+
+def read_video(path):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def synthetic_clip(count=300, size=(1280, 720), radius=24):
+    width, height = size
+    noise = np.random.default_rng(0).integers(60, 120, (height, width, 1),
+                                              dtype=np.uint8)
+    background = np.repeat(noise, 3, axis=2)
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        # Hidden for 10 frames out of every 100.
+        if index % 100 < 90:
+            angle = index / 40
+            centre = (int(width / 2 + width / 3 * np.cos(angle)),
+                      int(height / 2 + height / 3 * np.sin(2 * angle)))
+            cv2.circle(frame, centre, radius, (200, 60, 40), -1)
+        frames.append(frame)
+    return frames
+
+
+def same(expected, found):
+    if len(expected.area) != len(found.area):
+        return False
+    return np.allclose(expected.centroid, found.centroid, atol=2)
+
+
+def main():
+    video = sys.argv[1] if len(sys.argv) > 1 else None
+    config = sys.argv[2] if len(sys.argv) > 2 else 'config.csv'
+    frames = read_video(video) if video else synthetic_clip()
+    full = ColorDetertor(config)
+    tracker = TrackingDetector(config)
+
+    start = time.perf_counter()
+    expected = [full.detections(frame, top_k=1) for frame in frames]
+    full_time = (time.perf_counter() - start) / len(frames)
+    start = time.perf_counter()
+    found = [tracker.track(frame) for frame in frames]
+    track_time = (time.perf_counter() - start) / len(frames)
+
+    agree = sum(map(same, expected, found))
+    print('Frames: {} x {}x{}'.format(len(frames), frames[0].shape[1],
+                                      frames[0].shape[0]))
+    print('Full frame: {:8.2f} ms/frame'.format(full_time * 1000))
+    print('Tracking:   {:8.2f} ms/frame'.format(track_time * 1000))
+    print('Speedup:    {:8.2f}x'.format(full_time / track_time))
+    print('Same detection as full frame: {} of {}'.format(agree,
+                                                           len(frames)))
+
+
+if __name__ == '__main__':
+    main()
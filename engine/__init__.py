@@ -0,0 +1,14 @@
+'''Qt-free colour masking engine shared by the GUI and the detectors.'''
+from .backends import BACKENDS, register_backend
+from .blobs import Blobs, find_blobs
+from .blur import BLURS
+from .buffers import BufferPool, ViewPool
+from .config import read_config, write_config
+from .gate import ChangeGate
+from .params import MaskParams
+from .pipeline import MaskEngine, Stage
+from .segment import SegmentEngine
+
+__all__ = ['BACKENDS', 'BLURS', 'Blobs', 'BufferPool', 'ChangeGate',
+           'MaskEngine', 'MaskParams', 'SegmentEngine', 'Stage', 'ViewPool',
+           'find_blobs', 'read_config', 'register_backend', 'write_config']
@@ -0,0 +1,38 @@
+import collections
+
+import cv2
+import numpy as np
+
+from .buffers import BufferPool
+
+Blobs = collections.namedtuple('Blobs', ['area', 'bbox', 'centroid'])
+Blobs.__doc__ = '''Connected regions of a mask, largest first.
+
+area is (K,) pixel counts, bbox (K, 4) rows of x, y, width, height and
+centroid (K, 2) rows of x, y.
+'''
+
+
+def find_blobs(mask, pool=None, min_area=1, max_area=None, top_k=None,
+               connectivity=8):
+    '''Blobs of mask from one connectedComponentsWithStats pass.
+
+    Blobs smaller than min_area or larger than max_area are dropped and
+    at most top_k of the largest are kept, all with array operations.
+    '''
+    pool = BufferPool() if pool is None else pool
+    labels = pool.get('blobs.labels', mask.shape, np.int32)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(
+        mask, labels=labels, connectivity=connectivity)
+    # Label 0 is the background.
+    stats, centroids = stats[1:], centroids[1:]
+    area = stats[:, cv2.CC_STAT_AREA]
+    keep = area >= min_area
+    if max_area is not None:
+        keep &= area <= max_area
+    index = np.flatnonzero(keep)
+    if top_k is not None and top_k < len(index):
+        largest = np.argpartition(-area[index], top_k - 1)[:top_k]
+        index = index[largest]
+    index = index[np.argsort(-area[index], kind='stable')]
+    return Blobs(area[index], stats[index, :4], centroids[index])
@@ -0,0 +1,78 @@
+import math
+import time
+
+import cv2
+
+
+def gaussian_sigma(k_size):
+    '''Sigma cv2.GaussianBlur derives from a kernel size when given 0.'''
+    return 0.3 * ((k_size - 1) * 0.5 - 1) + 0.8
+
+
+def gaussian_blur(frame, k_size, pool, dst=None):
+    return cv2.GaussianBlur(frame, (k_size, k_size), 0, dst=dst)
+
+
+def box_blur(frame, k_size, pool, dst=None):
+    '''Three box passes whose combined variance matches the Gaussian.'''
+    width = int(round(math.sqrt(4 * gaussian_sigma(k_size) ** 2 + 1)))
+    width += width % 2 == 0
+    if dst is None:
+        dst = pool.get('blur.out', frame.shape)
+    scratch = pool.get('blur.box', frame.shape)
+    cv2.blur(frame, (width, width), dst=dst)
+    cv2.blur(dst, (width, width), dst=scratch)
+    return cv2.blur(scratch, (width, width), dst=dst)
+
+
+def stack_blur(frame, k_size, pool, dst=None):
+    return cv2.stackBlur(frame, (k_size, k_size), dst=dst)
+
+
+def pyramid_blur(frame, k_size, pool, dst=None):
+    '''Blur a 2x or 4x smaller copy and scale it back up.'''
+    factor = 4 if k_size >= 31 else 2
+    height, width = frame.shape[:2]
+    size = (max(1, width // factor), max(1, height // factor))
+    small = pool.get('blur.small', (size[1], size[0]) + frame.shape[2:])
+    cv2.resize(frame, size, dst=small, interpolation=cv2.INTER_AREA)
+    small_k = max(1, (k_size // factor) | 1)
+    blurred = pool.get('blur.small_blurred', small.shape)
+    cv2.GaussianBlur(small, (small_k, small_k),
+                     gaussian_sigma(k_size) / factor, dst=blurred)
+    return cv2.resize(blurred, (width, height), dst=dst,
+                      interpolation=cv2.INTER_LINEAR)
+
+
+BLURS = {
+    'gaussian': gaussian_blur,
+    'box': box_blur,
+    'pyramid': pyramid_blur,
+}
+if hasattr(cv2, 'stackBlur'):
+    BLURS['stack'] = stack_blur
+
+
+def choose_blur(frame, k_size, pool, tolerance):
+    '''Name of the fastest blur within tolerance of the Gaussian result.
+
+    tolerance is the largest accepted mean absolute difference, in grey
+    levels, from cv2.GaussianBlur on this frame.
+    '''
+    reference = gaussian_blur(frame, k_size, pool,
+                              dst=pool.get('blur.reference', frame.shape))
+    trial = pool.get('blur.trial', frame.shape)
+    difference = pool.get('blur.difference', frame.shape)
+    best, best_time = 'gaussian', None
+    for name, blur in BLURS.items():
+        blur(frame, k_size, pool, dst=trial)
+        start = time.perf_counter()
+        blur(frame, k_size, pool, dst=trial)
+        elapsed = time.perf_counter() - start
+        cv2.absdiff(trial, reference, dst=difference)
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        if sum(cv2.mean(difference)[:channels]) / channels > tolerance:
+            continue
+        if best_time is None or elapsed < best_time:
+            best, best_time = name, elapsed
+    return best
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class BufferPool(object):
+    '''Scratch arrays reused from frame to frame.
+
+    Arrays are keyed by owner name, shape and dtype. allocations counts
+    every array the pool had to create, so once the frame size settles it
+    should stop growing; arrays OpenCV allocates internally are not seen.
+    '''
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = np.empty(shape, dtype)
+            self._buffers[key] = buffer
+            self.allocations += 1
+        return buffer
+
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+class ViewPool(BufferPool):
+    '''BufferPool handing out views into one array per name.
+
+    The array for a name grows to the largest height and width asked for,
+    and smaller requests get its top-left corner. A user whose image size
+    keeps changing, such as a tracking window, then holds one set of
+    buffers instead of one per size. Views are not contiguous, which
+    OpenCV's dst arguments accept.
+    '''
+
+    def get(self, name, shape, dtype=np.uint8):
+        if len(shape) < 2:
+            return super().get(name, shape, dtype)
+        height, width = shape[:2]
+        key = (name, tuple(shape[2:]), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is not None:
+            if buffer.shape[0] >= height and buffer.shape[1] >= width:
+                return buffer[:height, :width]
+            height = max(height, buffer.shape[0])
+            width = max(width, buffer.shape[1])
+        buffer = np.empty((height, width) + tuple(shape[2:]), dtype)
+        self._buffers[key] = buffer
+        self.allocations += 1
+        return buffer[:shape[0], :shape[1]]
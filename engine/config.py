@@ -0,0 +1,96 @@
+import csv
+
+from .blur import BLURS
+from .params import MaskParams
+from .pipeline import MaskEngine
+
+NAMES = ["SN", "Name", "Value"]
+
+
+def _flag(value):
+    return value.lower() in ['true', '1']
+
+
+def _size(value):
+    return int(value.split('x')[0])
+
+
+def _choice(value, choices, default):
+    # A name this build does not know (say 'stack' without cv2.stackBlur)
+    # falls back to the default instead of failing at the first render.
+    value = value.lower()
+    return value if value in choices else default
+
+
+def read_config(filename):
+    '''Read a saved configuration CSV into MaskParams.
+
+    Rows are looked up by name, so files written before a setting existed
+    still load and get its default.
+    '''
+    with open(filename, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        value = {}
+        for row in reader:
+            value[row[NAMES[1]]] = row[NAMES[2]]
+    defaults = MaskParams()
+    params = MaskParams(
+        lower_range=(int(value['Low Hue']),
+                     int(value['Low Saturation']),
+                     int(value['Low Value'])),
+        upper_range=(int(value['High Hue']),
+                     int(value['High Saturation']),
+                     int(value['High Value'])),
+        hue_wrap=_flag(value.get('Hue Wrap', 'False')),
+        # Files without the row predate the setting and hold 0-179 hues.
+        hue_scale=int(value.get('Hue Scale', 180)),
+        blur=_flag(value['Gaussian Blur']),
+        k_size=_size(value['Kernel Size']),
+        blur_backend=_choice(value.get('Blur Backend', defaults.blur_backend),
+                             list(BLURS) + ['auto'], defaults.blur_backend),
+        erode=_flag(value['Remove Erodes']),
+        erode_i=int(value['Remove Erodes Iterations']),
+        dilate=_flag(value['Dilate Mask']),
+        dilate_i=int(value['Dilate Iterations']),
+        invert=_flag(value['Invert Mask']),
+        show=_flag(value.get('Show Masked Image', 'False')),
+        morph=_choice(value.get('Morphology', defaults.morph),
+                      list(MaskEngine.MORPH_OPS) + ['none'], defaults.morph),
+        morph_i=int(value.get('Morphology Iterations', defaults.morph_i)),
+        kernel_shape=_choice(value.get('Kernel Shape', defaults.kernel_shape),
+                             MaskEngine.KERNEL_SHAPES, defaults.kernel_shape),
+        kernel_size=_size(value.get('Morphology Kernel Size',
+                                    str(defaults.kernel_size))))
+    return params
+
+
+def write_config(filename, params):
+    lower_range, upper_range = params.lower_range, params.upper_range
+    rows = [
+        ("Low Hue", lower_range[0]),
+        ("High Hue", upper_range[0]),
+        ("Low Saturation", lower_range[1]),
+        ("High Saturation", upper_range[1]),
+        ("Low Value", lower_range[2]),
+        ("High Value", upper_range[2]),
+        ("Gaussian Blur", params.blur),
+        ("Kernel Size", '{0}x{0}'.format(params.k_size)),
+        ("Remove Erodes", params.erode),
+        ("Remove Erodes Iterations", params.erode_i),
+        ("Dilate Mask", params.dilate),
+        ("Dilate Iterations", params.dilate_i),
+        ("Invert Mask", params.invert),
+        ("Show Masked Image", params.show),
+        ("Morphology", params.morph),
+        ("Morphology Iterations", params.morph_i),
+        ("Kernel Shape", params.kernel_shape),
+        ("Morphology Kernel Size", '{0}x{0}'.format(params.kernel_size)),
+        ("Blur Backend", params.blur_backend),
+        ("Hue Wrap", params.hue_wrap),
+        ("Hue Scale", params.hue_scale),
+    ]
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(NAMES)
+        for line_num, (name, value) in enumerate(rows, 1):
+            writer.writerow([line_num, name, value])
@@ -0,0 +1,54 @@
+import cv2
+
+from .buffers import BufferPool
+
+
+class ChangeGate(object):
+    '''Tell frames that changed from frames that can reuse the last mask.
+
+    Each frame is shrunk to a thumbnail THUMBNAIL pixels on its long edge,
+    bilinear sampling to SAMPLE times that size first and averaging the
+    rest, and compared with the thumbnail of the last frame let through.
+    A frame passes when any thumbnail pixel moved by more than threshold
+    grey levels in any channel. Comparing with the last frame let through,
+    not the previous one, keeps a slow drift from being skipped forever.
+    '''
+    THUMBNAIL = 64
+    SAMPLE = 4
+
+    def __init__(self, threshold=8, pool=None):
+        self.threshold = threshold
+        self.pool = BufferPool() if pool is None else pool
+        self.reference = None
+        self.skipped = 0
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.THUMBNAIL / max(height, width)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        channels = frame.shape[2:]
+        sample = (size[0] * self.SAMPLE, size[1] * self.SAMPLE)
+        if sample[0] < width and sample[1] < height:
+            frame = cv2.resize(
+                frame, sample, interpolation=cv2.INTER_LINEAR,
+                dst=self.pool.get('gate.sample', sample[::-1] + channels))
+        return cv2.resize(
+            frame, size, interpolation=cv2.INTER_AREA,
+            dst=self.pool.get('gate.thumbnail', size[::-1] + channels))
+
+    def changed(self, frame):
+        thumbnail = self.thumbnail(frame)
+        reference = self.reference
+        if reference is not None and reference.shape == thumbnail.shape:
+            difference = self.pool.get('gate.difference', thumbnail.shape)
+            cv2.absdiff(thumbnail, reference, dst=difference)
+            rows = difference.reshape(difference.shape[0], -1)
+            if cv2.minMaxLoc(rows)[1] <= self.threshold:
+                self.skipped += 1
+                return False
+        self.reference = self.pool.get('gate.reference', thumbnail.shape)
+        self.reference[:] = thumbnail
+        return True
+
+    def reset(self):
+        self.reference = None
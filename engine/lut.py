@@ -0,0 +1,102 @@
+import threading
+
+import cv2
+import numpy as np
+
+from .buffers import BufferPool
+
+
+class MaskLUT(object):
+    '''Threshold BGR frames through a table covering all 2**24 colours.
+
+    The table is rebuilt on a background thread whenever the HSV range
+    changes; until it is ready, frames are thresholded the usual way with
+    cvtColor and inRange. The per-frame gather is a random read into a
+    16 MB table and does not beat cvtColor + inRange where OpenCV has SIMD
+    kernels; see benchmarks/lut_benchmark.py.
+    '''
+
+    def __init__(self, pool=None):
+        self.table = None
+        self.pool = BufferPool() if pool is None else pool
+        self._wanted = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def hsv_table(hue_full=False):
+        '''HSV value of every BGR colour, indexed by B | G << 8 | R << 16.
+
+        At 48 MB it is made for each build and dropped again rather than
+        kept for the life of the process.
+        '''
+        bgra = np.empty((4096, 4096, 4), np.uint8)
+        codes = bgra.reshape(-1, 4).view('<u4')[:, 0]
+        codes[:] = np.arange(1 << 24, dtype=np.uint32)
+        code = cv2.COLOR_BGR2HSV_FULL if hue_full else cv2.COLOR_BGR2HSV
+        return cv2.cvtColor(bgra, code)
+
+    @classmethod
+    def build(cls, lower_range, upper_range, hue_full=False):
+        hsv = cls.hsv_table(hue_full)
+        if lower_range[0] <= upper_range[0]:
+            table = cv2.inRange(hsv, lower_range, upper_range)
+        else:
+            # Wrapped hue costs an extra pass here, once per range change,
+            # and nothing extra per frame.
+            table = cv2.inRange(hsv, lower_range,
+                                (255,) + tuple(upper_range[1:]))
+            table |= cv2.inRange(hsv, (0,) + tuple(lower_range[1:]),
+                                 upper_range)
+        return table.reshape(-1)
+
+    def _rebuild(self):
+        while True:
+            with self._lock:
+                ranges = self._wanted
+                if self.table is not None and self.table[0] == ranges:
+                    self._thread = None
+                    return
+            table = self.build(*ranges)
+            self.table = (ranges, table)
+
+    def update(self, lower_range, upper_range, wait=False, hue_full=False):
+        ranges = (tuple(lower_range), tuple(upper_range), hue_full)
+        with self._lock:
+            self._wanted = ranges
+            if self.table is not None and self.table[0] == ranges:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._rebuild,
+                                                daemon=True)
+                self._thread.start()
+            thread = self._thread
+        if wait:
+            thread.join()
+
+    def lookup(self, frame, table, dst=None):
+        height, width = frame.shape[:2]
+        bgra = self.pool.get('lut.bgra', (height, width, 4))
+        index = self.pool.get('lut.index', (height, width), np.intp)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=bgra)
+        codes = bgra.view('<u4')[..., 0]
+        np.bitwise_and(codes, 0xFFFFFF, out=index)
+        if dst is None:
+            dst = np.empty((height, width), np.uint8)
+        np.take(table, index, out=dst, mode='clip')
+        return dst
+
+    def fallback(self, hsv, lower_range, upper_range, dst=None,
+                 hue_full=False):
+        return cv2.inRange(hsv, lower_range, upper_range, dst=dst)
+
+    def mask(self, frame, lower_range, upper_range, dst=None, hue_full=False):
+        self.update(lower_range, upper_range, hue_full=hue_full)
+        table = self.table
+        if table is None or table[0] != (tuple(lower_range),
+                                         tuple(upper_range), hue_full):
+            hsv = self.pool.get('lut.hsv', frame.shape)
+            code = cv2.COLOR_BGR2HSV_FULL if hue_full else cv2.COLOR_BGR2HSV
+            cv2.cvtColor(frame, code, dst=hsv)
+            return self.fallback(hsv, lower_range, upper_range, dst, hue_full)
+        return self.lookup(frame, table[1], dst)
@@ -0,0 +1,68 @@
+class MaskParams(object):
+    '''Immutable settings of one masking pass.
+
+    A snapshot is never changed in place; replace returns a new one. Swapping
+    the snapshot a reader uses is then a single reference assignment, and a
+    reader never sees a half-updated set of ranges.
+
+    Hues are on OpenCV's 0-179 scale when hue_scale is 180 and in degrees,
+    0-359, when it is 360.
+    '''
+    __slots__ = ('lower_range', 'upper_range', 'hue_wrap', 'hue_scale',
+                 'blur', 'k_size', 'blur_backend', 'erode', 'erode_i',
+                 'dilate', 'dilate_i', 'invert', 'show', 'backend', 'overlay',
+                 'overlay_colour', 'morph', 'morph_i', 'kernel_shape',
+                 'kernel_size')
+
+    def __init__(self, lower_range=(0, 0, 0), upper_range=(359, 255, 255),
+                 hue_wrap=False, hue_scale=180, blur=False, k_size=11,
+                 blur_backend='gaussian', erode=False, erode_i=1,
+                 dilate=False, dilate_i=1, invert=False, show=False,
+                 backend='opencv', overlay='masked',
+                 overlay_colour=(0, 0, 0), morph='none', morph_i=1,
+                 kernel_shape='rect', kernel_size=3):
+        assign = super().__setattr__
+        assign('lower_range', tuple(lower_range))
+        assign('upper_range', tuple(upper_range))
+        assign('hue_wrap', hue_wrap)
+        assign('hue_scale', hue_scale)
+        assign('blur', blur)
+        assign('k_size', k_size)
+        assign('blur_backend', blur_backend)
+        assign('erode', erode)
+        assign('erode_i', erode_i)
+        assign('dilate', dilate)
+        assign('dilate_i', dilate_i)
+        assign('invert', invert)
+        assign('show', show)
+        assign('backend', backend)
+        assign('overlay', overlay)
+        assign('overlay_colour', tuple(overlay_colour))
+        assign('morph', morph)
+        assign('morph_i', morph_i)
+        assign('kernel_shape', kernel_shape)
+        assign('kernel_size', kernel_size)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('MaskParams is immutable, use replace()')
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def replace(self, **changes):
+        fields = dict(zip(self.__slots__, self.values()))
+        fields.update(changes)
+        return MaskParams(**fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, MaskParams):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __hash__(self):
+        return hash(self.values())
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(name, getattr(self, name))
+                           for name in self.__slots__)
+        return 'MaskParams({})'.format(fields)
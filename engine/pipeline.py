@@ -0,0 +1,329 @@
+import collections
+
+import cv2
+
+from .backends import BACKENDS
+from .blur import BLURS, choose_blur
+from .buffers import BufferPool
+
+
+class Stage(object):
+    '''Pipeline step that remembers its last output.
+
+    The key of a stage is made of the key of the stage feeding it plus its
+    own parameters, so a stage only runs again when something upstream of
+    it, or one of its own settings, has changed. Output goes into a pooled
+    array shaped like the first argument, or like one plane of it when
+    plane is set.
+    '''
+
+    def __init__(self, name, function, pool, plane=False):
+        self.name = name
+        self.function = function
+        self.pool = pool
+        self.plane = plane
+        self.key = None
+        self.output = None
+        self.runs = 0
+
+    def run(self, key, source, *args):
+        if key != self.key:
+            shape = source.shape[:2] if self.plane else source.shape
+            dst = self.pool.get(self.name, shape)
+            self.output = self.function(source, *args, dst=dst)
+            self.key = key
+            self.runs += 1
+        return self.output
+
+
+class MaskEngine(object):
+    '''Blur, HSV threshold, morphology and compositing of BGR frames.
+
+    The arrays returned by process belong to the engine and are
+    overwritten by the next call; copy them to keep them.
+    '''
+    OVERLAYS = ('masked', 'tint', 'outline')
+    TINT_ALPHA = 0.5
+    MORPH_OPS = {
+        'open': cv2.MORPH_OPEN,
+        'close': cv2.MORPH_CLOSE,
+        'gradient': cv2.MORPH_GRADIENT,
+        'tophat': cv2.MORPH_TOPHAT,
+    }
+    KERNEL_SHAPES = {
+        'rect': cv2.MORPH_RECT,
+        'ellipse': cv2.MORPH_ELLIPSE,
+        'cross': cv2.MORPH_CROSS,
+    }
+    # From this many iterations on, one pass with a grown rectangle beats
+    # repeated passes with the small one.
+    FUSE_ITERATIONS = 8
+    # Mean grey-level difference from GaussianBlur the 'auto' blur accepts.
+    BLUR_TOLERANCE = 1.0
+    # Top of each HSV channel as produced by cvtColor on 8-bit frames.
+    CHANNEL_MAX = (179, 255, 255)
+    # Top hue of COLOR_BGR2HSV_FULL, which degrees 0-359 are mapped onto.
+    FULL_HUE_MAX = 255
+
+    def __init__(self, pool=None):
+        self.pool = BufferPool() if pool is None else pool
+        self.backends = {}
+        self._frame = None
+        self._generation = 0
+        self.blur = Stage('blur', self.blur_frame, self.pool)
+        self.convert = Stage('convert', self.convert_frame, self.pool)
+        self.threshold = Stage('threshold', self.threshold_frame, self.pool,
+                               plane=True)
+        self.erode = Stage('erode', self.erode_mask, self.pool)
+        self.dilate = Stage('dilate', self.dilate_mask, self.pool)
+        self.morph = Stage('morph', self.morph_mask, self.pool)
+        self.invert = Stage('invert', self.invert_mask, self.pool)
+        self.composite = Stage('composite', self.composite_mask, self.pool)
+        self._solid = None
+        self._kernels = {}
+        self.blur_choices = {}
+        self.threshold_path = None
+        self.path_counts = collections.Counter()
+
+    def backend(self, name):
+        if name not in self.backends:
+            self.backends[name] = BACKENDS[name](self.pool)
+        return self.backends[name]
+
+    def blur_backend(self, frame, k_size, backend):
+        if backend != 'auto':
+            return backend
+        key = (frame.shape, k_size)
+        if key not in self.blur_choices:
+            self.blur_choices[key] = choose_blur(frame, k_size, self.pool,
+                                                 self.BLUR_TOLERANCE)
+        return self.blur_choices[key]
+
+    def blur_frame(self, frame, k_size, backend, dst=None):
+        blur = BLURS[self.blur_backend(frame, k_size, backend)]
+        return blur(frame, k_size, self.pool, dst=dst)
+
+    @staticmethod
+    def convert_frame(frame, backend, hue_full, dst=None):
+        return backend.convert(frame, dst=dst, hue_full=hue_full)
+
+    def channel_max(self, hue_scale=180):
+        if hue_scale == 360:
+            return (self.FULL_HUE_MAX,) + self.CHANNEL_MAX[1:]
+        return self.CHANNEL_MAX
+
+    @staticmethod
+    def full_hue(degrees):
+        '''COLOR_BGR2HSV_FULL hue of a hue given in degrees.'''
+        return min(255, int(degrees * 256 / 360 + 0.5))
+
+    def hue_ranges(self, params):
+        '''Ranges to threshold with, low hue above high hue when wrapped.
+
+        Degree hues are moved onto the 0-255 scale of COLOR_BGR2HSV_FULL
+        here, once per range, so frames need no rescaling.
+        '''
+        lower_range, upper_range = params.lower_range, params.upper_range
+        if params.hue_scale == 360:
+            lower_range = (self.full_hue(lower_range[0]),) + lower_range[1:]
+            upper_range = (self.full_hue(upper_range[0]),) + upper_range[1:]
+        low_hue, high_hue = lower_range[0], upper_range[0]
+        if params.hue_wrap and low_hue > high_hue:
+            hue_max = self.channel_max(params.hue_scale)[0]
+            if low_hue > hue_max:
+                # Nothing above low_hue exists, only [0, high_hue] is left.
+                lower_range = (0,) + lower_range[1:]
+            elif low_hue - high_hue <= 1 or high_hue >= hue_max:
+                lower_range = (0,) + lower_range[1:]
+                upper_range = (hue_max,) + upper_range[1:]
+        return lower_range, upper_range
+
+    def classify_ranges(self, lower_range, upper_range, hue_wrap=False,
+                        hue_scale=180):
+        '''Name the cheapest way to threshold with these ranges.
+
+        empty and full ranges give a constant mask, and when only Value is
+        constrained the test runs on max(B, G, R) without an HSV
+        conversion. Anything else goes to the selected backend.
+        '''
+        bounds = list(zip(lower_range, upper_range,
+                          self.channel_max(hue_scale)))
+        wrapped = hue_wrap and lower_range[0] > upper_range[0]
+        if any(lower > upper for lower, upper, top in bounds[wrapped:]):
+            return 'empty'
+        if wrapped:
+            return 'backend'
+        unconstrained = [lower <= 0 and upper >= top
+                         for lower, upper, top in bounds]
+        if all(unconstrained):
+            return 'full'
+        if unconstrained[0] and unconstrained[1]:
+            return 'value'
+        return 'backend'
+
+    def value_mask(self, frame, low, high, dst=None):
+        # max(B, G, R) <= high holds when every channel is <= high, and
+        # max(B, G, R) >= low fails only when every channel is < low.
+        if high < 255:
+            cv2.inRange(frame, (0, 0, 0), (high, high, high), dst=dst)
+        else:
+            dst.fill(255)
+        if low > 0:
+            below = self.pool.get('value.below', dst.shape)
+            cv2.inRange(frame, (0, 0, 0), (low - 1, low - 1, low - 1),
+                        dst=below)
+            cv2.subtract(dst, below, dst=dst)
+        return dst
+
+    def threshold_frame(self, image, path, backend, lower_range, upper_range,
+                        hue_full=False, dst=None):
+        if path == 'empty':
+            dst.fill(0)
+            return dst
+        if path == 'full':
+            dst.fill(255)
+            return dst
+        if path == 'value':
+            return self.value_mask(image, lower_range[2], upper_range[2],
+                                   dst=dst)
+        return backend.threshold(image, lower_range, upper_range, dst=dst,
+                                 hue_full=hue_full)
+
+    def kernel(self, shape, size, iterations):
+        '''Structuring element and iteration count for a morphology op.
+
+        Iterating a rectangle k times is the same as one pass with a
+        rectangle k times as wide, so long runs are fused into one pass.
+        '''
+        key = (shape, size, iterations)
+        kernel = self._kernels.get(key)
+        if kernel is None:
+            if shape == 'rect' and iterations >= self.FUSE_ITERATIONS:
+                size = iterations * (size - 1) + 1
+                iterations = 1
+            element = cv2.getStructuringElement(self.KERNEL_SHAPES[shape],
+                                                (size, size))
+            kernel = self._kernels[key] = (element, iterations)
+        return kernel
+
+    def erode_mask(self, mask, shape, size, iterations, dst=None):
+        kernel, iterations = self.kernel(shape, size, iterations)
+        return cv2.erode(mask, kernel, dst=dst, iterations=iterations)
+
+    def dilate_mask(self, mask, shape, size, iterations, dst=None):
+        kernel, iterations = self.kernel(shape, size, iterations)
+        return cv2.dilate(mask, kernel, dst=dst, iterations=iterations)
+
+    def morph_mask(self, mask, op, shape, size, iterations, dst=None):
+        kernel, iterations = self.kernel(shape, size, iterations)
+        return cv2.morphologyEx(mask, self.MORPH_OPS[op], kernel, dst=dst,
+                                iterations=iterations)
+
+    @staticmethod
+    def invert_mask(mask, dst=None):
+        return cv2.bitwise_not(mask, dst=dst)
+
+    def solid(self, shape, colour):
+        solid = self.pool.get('solid', shape)
+        if self._solid != (shape, colour):
+            solid[:] = colour
+            self._solid = (shape, colour)
+        return solid
+
+    def composite_mask(self, image, mask, mode, colour, dst=None):
+        '''Show image through mask into dst.
+
+        masked keeps the image inside the mask over a plain colour, tint
+        blends the colour into the masked area and outline draws the mask
+        edge over the image. Each fills dst with the background first, the
+        colour or the image, then copies the foreground through the mask;
+        tint also makes one addWeighted pass for the blended colour.
+        '''
+        if mode == 'masked':
+            dst[:] = colour
+            return cv2.copyTo(image, mask, dst)
+        solid = self.solid(image.shape, colour)
+        if mode == 'tint':
+            tinted = cv2.addWeighted(image, 1 - self.TINT_ALPHA, solid,
+                                     self.TINT_ALPHA, 0,
+                                     dst=self.pool.get('tinted', image.shape))
+            dst[:] = image
+            return cv2.copyTo(tinted, mask, dst)
+        if mode == 'outline':
+            edges = cv2.morphologyEx(mask, cv2.MORPH_GRADIENT, None,
+                                     dst=self.pool.get('edges', mask.shape))
+            dst[:] = image
+            return cv2.copyTo(solid, edges, dst)
+        raise ValueError('Unknown overlay mode: {}'.format(mode))
+
+    def blurred(self, frame, params, cached=False):
+        '''Key and image of frame after the blur stage.'''
+        if not cached or frame is not self._frame:
+            self._frame = frame
+            self._generation += 1
+        key = self._generation
+        image = frame
+        if params.blur:
+            key = (key, 'blur', params.k_size, params.blur_backend)
+            image = self.blur.run(key, image, params.k_size,
+                                  params.blur_backend)
+        return key, image
+
+    def converted(self, key, image, params):
+        '''Key and image of a blurred image after the HSV conversion.'''
+        backend = self.backend(params.backend)
+        if backend.convert is None:
+            return key, image
+        hue_full = params.hue_scale == 360
+        key = (key, 'convert', params.backend, hue_full)
+        return key, self.convert.run(key, image, backend, hue_full)
+
+    def mask(self, key, image, params, front=None):
+        '''Key and mask of a blurred image, before any compositing.
+
+        The HSV conversion, when one is needed, is taken from front, so
+        engines masking the same image with different ranges can share it.
+        '''
+        backend = self.backend(params.backend)
+        lower_range, upper_range = self.hue_ranges(params)
+        path = self.classify_ranges(lower_range, upper_range, params.hue_wrap,
+                                    params.hue_scale)
+        hue_full = params.hue_scale == 360
+        if path == 'backend':
+            path = params.backend
+            key, image = (front or self).converted(key, image, params)
+        key = (key, 'threshold', path, lower_range, upper_range, hue_full)
+        mask = self.threshold.run(key, image, path, backend,
+                                  lower_range, upper_range, hue_full)
+        self.threshold_path = path
+        self.path_counts[path] += 1
+
+        kernel = (params.kernel_shape, params.kernel_size)
+        if params.erode:
+            key = (key, 'erode', kernel, params.erode_i)
+            mask = self.erode.run(key, mask, *kernel, params.erode_i)
+        if params.dilate:
+            key = (key, 'dilate', kernel, params.dilate_i)
+            mask = self.dilate.run(key, mask, *kernel, params.dilate_i)
+        if params.morph != 'none':
+            key = (key, 'morph', params.morph, kernel, params.morph_i)
+            mask = self.morph.run(key, mask, params.morph, *kernel,
+                                  params.morph_i)
+        if params.invert:
+            key = (key, 'invert')
+            mask = self.invert.run(key, mask)
+        return key, mask
+
+    def process(self, frame, params, cached=False):
+        '''Mask frame with the settings held by params (a MaskParams).
+
+        With cached set, passing the same, unmodified frame object again
+        reuses every stage whose inputs did not change.
+        '''
+        key, image = self.blurred(frame, params, cached)
+        key, mask = self.mask(key, image, params)
+        if params.show:
+            key = (key, 'show', params.overlay, params.overlay_colour)
+            mask = self.composite.run(key, frame, mask, params.overlay,
+                                      params.overlay_colour)
+        return mask
@@ -0,0 +1,79 @@
+import cv2
+
+from .buffers import BufferPool
+from .pipeline import MaskEngine
+
+
+class SegmentEngine(object):
+    '''Mask several colour classes of a frame in one pass.
+
+    Classes that agree on blur, backend and hue scale share one blur and
+    one HSV conversion per frame; each class then only thresholds and
+    cleans up its own mask. The result is a label image, 0 for background
+    and i + 1 where class i matched, later classes winning where masks
+    overlap, or with packed set, one bit per class (bit i for class i).
+
+    Like MaskEngine, the arrays returned belong to the engine and are
+    overwritten by the next call.
+    '''
+    MAX_LABELS = 255
+    MAX_PACKED = 8
+
+    def __init__(self, pool=None):
+        self.pool = BufferPool() if pool is None else pool
+        self.fronts = {}
+        self._serial = 0
+        self.engines = []
+        self.masks = []
+
+    @staticmethod
+    def front_key(params):
+        blur = (params.k_size, params.blur_backend) if params.blur else None
+        return (blur, params.backend, params.hue_scale)
+
+    def new_front(self):
+        self._serial += 1
+        return self._serial, MaskEngine()
+
+    def segment(self, frame, classes, cached=False, packed=False, dst=None):
+        '''Label image (or packed bits) of frame for a list of MaskParams.'''
+        limit = self.MAX_PACKED if packed else self.MAX_LABELS
+        if len(classes) > limit:
+            raise ValueError('At most {} classes fit, got {}'.format(
+                limit, len(classes)))
+        while len(self.engines) < len(classes):
+            self.engines.append(MaskEngine())
+        del self.engines[len(classes):]
+        shape = frame.shape[:2]
+        if dst is None:
+            dst = self.pool.get('packed' if packed else 'labels', shape)
+        dst.fill(0)
+        scratch = self.pool.get('segment.class', shape)
+
+        # Only fronts the current classes use are kept, so sweeping a
+        # setting does not leave a full-frame engine behind per value.
+        fronts, self.fronts = self.fronts, {}
+        blurred = {}
+        self.masks = []
+        for index, params in enumerate(classes):
+            name = self.front_key(params)
+            if name not in self.fronts:
+                self.fronts[name] = fronts.get(name) or self.new_front()
+            serial, front = self.fronts[name]
+            if name not in blurred:
+                blurred[name] = front.blurred(frame, params, cached)
+            key, image = blurred[name]
+            # Front generations only count within one front, so the front's
+            # serial is part of the key the class engine remembers.
+            key, mask = self.engines[index].mask((serial, key), image, params,
+                                                 front)
+            self.masks.append(mask)
+            # Masks hold 0 or 255, so and-ing with a value keeps it where
+            # the class matched and 0 elsewhere.
+            if packed:
+                cv2.bitwise_and(mask, 1 << index, dst=scratch)
+                cv2.bitwise_or(dst, scratch, dst=dst)
+            else:
+                cv2.bitwise_and(mask, index + 1, dst=scratch)
+                cv2.max(dst, scratch, dst=dst)
+        return dst
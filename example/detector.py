@@ -1,5 +1,12 @@
+import os
+import sys
 import cv2
-import csv
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import (Blobs, ChangeGate, MaskEngine, MaskParams, SegmentEngine,
+                    ViewPool, find_blobs, read_config)
 
 
 class Detector(object):
@@ -8,35 +15,33 @@ class Detector(object):
         self.printConfig()
 
     def readConfig(self, filename):
-        names = ["SN", "Name", "Value"]
-        with open(filename, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            value = []
-            for row in reader:
-                value.append(row[names[2]])
-            lh = int(value[0])
-            hh = int(value[1])
-            ls = int(value[2])
-            hs = int(value[3])
-            lv = int(value[4])
-            hv = int(value[5])
-            self.blur = (value[6].lower() in ['true', '1'])
-            self.k_size = int(value[7].split('x')[0])
-            self.erode = (value[8].lower() in ['true', '1'])
-            self.erode_i = int(value[9])
-            self.dilate = (value[10].lower() in ['true', '1'])
-            self.dilate_i = int(value[11])
-            self.invert = (value[12].lower() in ['true', '1'])
-
-            self.lower_range = (lh, ls, lv)
-            self.upper_range = (hh, hs, hv)
+        params = read_config(filename)
+        self.lower_range = params.lower_range
+        self.upper_range = params.upper_range
+        self.hue_wrap = params.hue_wrap
+        self.hue_scale = params.hue_scale
+        self.blur = params.blur
+        self.k_size = params.k_size
+        self.blur_backend = params.blur_backend
+        self.erode = params.erode
+        self.erode_i = params.erode_i
+        self.dilate = params.dilate
+        self.dilate_i = params.dilate_i
+        self.invert = params.invert
+        self.morph = params.morph
+        self.morph_i = params.morph_i
+        self.kernel_shape = params.kernel_shape
+        self.kernel_size = params.kernel_size
 
     def printConfig(self):
         print('Lower Range: {}'.format(self.lower_range))
         print('Higher Range: {}'.format(self.upper_range))
+        print('Hue Wrap: {}'.format(self.hue_wrap))
+        print('Hue Scale: 0-{}'.format(self.hue_scale - 1))
         print('Blur: {}'.format(self.blur))
         if self.blur:
             print('Kernel Size: {}'.format(self.k_size))
+            print('Blur Backend: {}'.format(self.blur_backend))
         print('Erode: {}'.format(self.erode))
         if self.erode:
             print('Erode Iterations: {}'.format(self.erode_i))
@@ -44,26 +49,126 @@ class Detector(object):
         if self.dilate:
             print('Dilate Iterations: {}'.format(self.dilate_i))
         print('Invert Mask: {}'.format(self.invert))
+        print('Morphology: {}'.format(self.morph))
+        if self.morph != 'none':
+            print('Morphology Iterations: {}'.format(self.morph_i))
+        print('Morphology Kernel: {0} {1}x{1}'.format(self.kernel_shape,
+                                                     self.kernel_size))
+
+    def mask_params(self):
+        return MaskParams(self.lower_range, self.upper_range,
+                          hue_wrap=self.hue_wrap, hue_scale=self.hue_scale,
+                          blur=self.blur, k_size=self.k_size,
+                          blur_backend=self.blur_backend,
+                          erode=self.erode, erode_i=self.erode_i,
+                          dilate=self.dilate, dilate_i=self.dilate_i,
+                          invert=self.invert, morph=self.morph,
+                          morph_i=self.morph_i,
+                          kernel_shape=self.kernel_shape,
+                          kernel_size=self.kernel_size)
 
 
 class MaskDetector(Detector):
-    def getMask(self, frame):
-        '''Return Mask'''
-        if self.blur:
-            frame = cv2.GaussianBlur(frame, (self.k_size, self.k_size), 0)
-        frame = cv2.cvtColor(frame.copy(), cv2.COLOR_BGR2HSV)
+    def __init__(self, filename='config.csv', change_threshold=None):
+        '''With change_threshold set, getMask returns the previous mask for
+        frames that differ from the last masked one by no more than that
+        many grey levels anywhere on a small thumbnail.
+        '''
+        self.engine = MaskEngine()
+        self.batch_engines = []
+        self.gate = None
+        if change_threshold is not None:
+            self.gate = ChangeGate(change_threshold)
+        self._last = (None, None)
+        super().__init__(filename)
 
-        mask = cv2.inRange(frame, self.lower_range, self.upper_range)
-        if self.erode:
-            mask = cv2.erode(mask, None, iterations=self.erode_i)
-        if self.dilate:
-            mask = cv2.dilate(mask, None, iterations=self.dilate_i)
-        if self.invert:
-            mask = 255 - mask
+    def getMask(self, frame):
+        '''Return Mask (reused by the next call, copy it to keep it)'''
+        params = self.mask_params()
+        if self.gate is not None:
+            last_params, mask = self._last
+            if not self.gate.changed(frame) and params == last_params:
+                return mask
+        mask = self.engine.process(frame, params)
+        self._last = (params, mask)
         return mask
 
+    def getMasks(self, frames, dst=None, workers=1):
+        '''Return (N, H, W) stack of masks for N frames of one size
+
+        frames is an (N, H, W, 3) array or any iterable of frames. Passing
+        the stack back as dst fills it again without a new allocation.
+        With workers above 1 the frames are split across that many
+        threads, each with its own engine; OpenCV releases the GIL, so
+        they run on separate cores.
+        '''
+        if not hasattr(frames, '__len__'):
+            frames = list(frames)
+        if len(frames) == 0:
+            if dst is None:
+                # An empty stack keeps its frame size when it has one.
+                size = frames.shape[1:3] if np.ndim(frames) == 4 else (0, 0)
+                dst = np.empty((0,) + tuple(size), np.uint8)
+            return dst
+        if dst is None:
+            dst = np.empty((len(frames),) + frames[0].shape[:2], np.uint8)
+        params = self.mask_params()
+        workers = max(1, min(workers, len(frames)))
+        while len(self.batch_engines) < workers:
+            self.batch_engines.append(MaskEngine())
+
+        def run(engine, start, stop):
+            for index in range(start, min(stop, len(frames))):
+                dst[index] = engine.process(frames[index], params)
+
+        if workers == 1:
+            run(self.batch_engines[0], 0, len(frames))
+            return dst
+        step = -(-len(frames) // workers)
+        with ThreadPoolExecutor(workers) as executor:
+            jobs = [executor.submit(run, engine, start, start + step)
+                    for engine, start in zip(self.batch_engines,
+                                             range(0, len(frames), step))]
+            for job in jobs:
+                job.result()
+        return dst
+
+
+class MultiMaskDetector(object):
+    def __init__(self, filenames=('config.csv',)):
+        self.detectors = [Detector(filename) for filename in filenames]
+        self.engine = SegmentEngine()
+
+    def getLabels(self, frame):
+        '''Return label image: 0 background, i + 1 where config i matched
+
+        Where colours overlap the later config wins. Configs with the same
+        blur settings share the blur and HSV conversion. The image is
+        reused by the next call, copy it to keep it.
+        '''
+        classes = [detector.mask_params() for detector in self.detectors]
+        return self.engine.segment(frame, classes)
+
+    def getBits(self, frame):
+        '''Return bit i set where config i matched (at most 8 configs)'''
+        classes = [detector.mask_params() for detector in self.detectors]
+        return self.engine.segment(frame, classes, packed=True)
+
 
 class ColorDetertor(MaskDetector):
+    MODES = ('count', 'contours')
+
+    def __init__(self, filename='config.csv', mode='count', min_area=1,
+                 change_threshold=None):
+        '''mode 'count' compares the number of mask pixels with min_area,
+        'contours' traces the mask with findContours.
+        '''
+        if mode not in self.MODES:
+            raise ValueError('Unknown detect mode: {}'.format(mode))
+        self.mode = mode
+        self.min_area = min_area
+        super().__init__(filename, change_threshold)
+
     @staticmethod
     def grab_contours(cnts):
         if len(cnts) == 2:
@@ -72,9 +177,96 @@ class ColorDetertor(MaskDetector):
             cnts = cnts[1]
         return cnts
 
+    def present(self, mask):
+        return cv2.countNonZero(mask) >= self.min_area
+
+    def detections(self, frame, min_area=None, max_area=None, top_k=None):
+        '''Return Blobs (area, bbox, centroid arrays) of the mask, largest
+        first; min_area defaults to the detector's own.
+        '''
+        if min_area is None:
+            min_area = self.min_area
+        return find_blobs(self.getMask(frame), self.engine.pool, min_area,
+                          max_area, top_k)
+
     def detect(self, frame):
         mask = self.getMask(frame)
+        if self.mode == 'count':
+            return self.present(mask)
         cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL,
                                 cv2.CHAIN_APPROX_SIMPLE)
         cnts = self.grab_contours(cnts)
         return (len(cnts) > 0)
+
+
+class TrackingDetector(ColorDetertor):
+    '''Follow the largest blob, masking only a window around it.
+
+    The window is WINDOW_SCALE times the last detection. A miss grows it
+    by grow, and after max_misses misses in a row the whole frame is
+    searched again. The window engine's buffers are views into one array
+    per buffer, grown to the largest window seen, so every window size
+    shares them.
+    '''
+    WINDOW_SCALE = 2.0
+    MIN_WINDOW = 64
+    WINDOW_STEP = 1.5
+
+    def __init__(self, filename='config.csv', min_area=1, grow=2.0,
+                 max_misses=3):
+        self.grow = grow
+        self.max_misses = max_misses
+        self.window = None
+        self.misses = 0
+        self.window_engine = MaskEngine(ViewPool())
+        super().__init__(filename, 'count', min_area)
+
+    def snap(self, size, limit):
+        snapped = self.MIN_WINDOW
+        while snapped < size and snapped < limit:
+            snapped = int(snapped * self.WINDOW_STEP)
+        return min(snapped, limit)
+
+    def place(self, centre, size, frame_size):
+        '''Window (x, y, width, height) around centre, None for the frame.'''
+        (width, height), (frame_width, frame_height) = size, frame_size
+        width = self.snap(width, frame_width)
+        height = self.snap(height, frame_height)
+        if width == frame_width and height == frame_height:
+            return None
+        x = min(max(0, int(centre[0] - width / 2)), frame_width - width)
+        y = min(max(0, int(centre[1] - height / 2)), frame_height - height)
+        return (x, y, width, height)
+
+    def track(self, frame):
+        '''Return Blobs of the largest detection, in frame coordinates
+
+        The Blobs are empty on a miss.
+        '''
+        frame_size = (frame.shape[1], frame.shape[0])
+        if self.window is None:
+            x, y = 0, 0
+            mask = self.getMask(frame)
+            pool = self.engine.pool
+        else:
+            x, y, width, height = self.window
+            mask = self.window_engine.process(
+                frame[y:y + height, x:x + width], self.mask_params())
+            pool = self.window_engine.pool
+        blobs = find_blobs(mask, pool, self.min_area, top_k=1)
+        if len(blobs.area):
+            blobs = Blobs(blobs.area, blobs.bbox + (x, y, 0, 0),
+                          blobs.centroid + (x, y))
+            self.misses = 0
+            size = blobs.bbox[0, 2:] * self.WINDOW_SCALE
+            self.window = self.place(blobs.centroid[0], size, frame_size)
+        elif self.window is not None:
+            self.misses += 1
+            if self.misses >= self.max_misses:
+                self.window = None
+            else:
+                x, y, width, height = self.window
+                centre = (x + width / 2, y + height / 2)
+                size = (width * self.grow, height * self.grow)
+                self.window = self.place(centre, size, frame_size)
+        return blobs
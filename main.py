@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
+import os
 import sys
 import cv2
-import csv
+import time
+import threading
+import collections
 import numpy as np
 
 from PyQt5.QtWidgets import QApplication, QWidget, QInputDialog, QLineEdit, QFileDialog
@@ -12,6 +15,8 @@ from PyQt5 import QtWidgets
 from PyQt5 import QtGui
 import about 
 import widget 
+from engine import (BLURS, ChangeGate, MaskEngine, MaskParams, SegmentEngine,
+                    read_config, write_config)
 
 
 class Ui(QtWidgets.QWidget):
@@ -33,138 +38,457 @@ class AboutWindow(QtWidgets.QMainWindow):
         self.hide()
 
 
-class CaptureFrame(QtCore.QObject):
-    image_data = QtCore.pyqtSignal(np.ndarray)
-
-    def __init__(self, camera_port=0, parent=None):
+def fit_long_edge(frame, long_edge):
+    if not long_edge:
+        return frame
+    height, width = frame.shape[:2]
+    scale = long_edge / max(height, width)
+    if scale == 1:
+        return frame
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(frame, size, interpolation=interpolation)
+
+
+class FrameQueue(object):
+    def __init__(self, maxsize=2):
+        self._frames = collections.deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._lock:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(frame)
+
+    def get(self):
+        # Hand over the newest frame; anything older is already stale.
+        with self._lock:
+            if self._frames:
+                frame = self._frames.pop()
+                self.dropped += len(self._frames)
+                self._frames.clear()
+                return frame
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class CaptureWorker(QtCore.QThread):
+    frame_ready = QtCore.pyqtSignal()
+
+    def __init__(self, frames, camera_port=0, parent=None):
         super().__init__(parent)
+        self.frames = frames
         self.port = camera_port
         self.camera = None
-        self.timer = QtCore.QBasicTimer()
         self.image_path = 'images/sample.jpg'
         self.video = False
+        self.paused = False
+        self.process_size = 540
+        self._image = None
+        self._image_key = None
+        self._dirty = True
+        self._running = False
+        self._wake = threading.Event()
+
+    def open_camera(self):
+        self.camera = cv2.VideoCapture(self.port)
+
+    def refresh(self):
+        self._dirty = True
+        self._wake.set()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        self.wait()
+
+    def read_image(self):
+        try:
+            stat = os.stat(self.image_path)
+        except OSError:
+            return False
+        key = (self.image_path, stat.st_mtime_ns, stat.st_size,
+               self.process_size)
+        if key == self._image_key:
+            return False
+        data = cv2.imread(self.image_path)
+        if data is None:
+            return False
+        self._image = fit_long_edge(data, self.process_size)
+        self._image_key = key
+        return True
+
+    def push(self, frame):
+        self.frames.put(frame)
+        self.frame_ready.emit()
+
+    def read_camera(self):
+        if self.camera is None:
+            self.open_camera()
+        elif not self.camera.isOpened():
+            self.camera.open(self.port)
+        read, data = self.camera.read()
+        if not read:
+            self._wake.wait(0.1)
+            self._wake.clear()
+            return
+        data = cv2.flip(data, 1)
+        self.push(fit_long_edge(data, self.process_size))
+
+    def read_still(self):
+        if self.camera is not None:
+            if self.camera.isOpened():
+                self.camera.release()
+                self._dirty = True
+        changed = self.read_image()
+        if (changed or self._dirty) and self._image is not None:
+            self._dirty = False
+            self.push(self._image)
+            return
+        # Nothing to do until a control changes; poll the file now and then
+        # so edits on disk are still picked up.
+        self._wake.wait(0.25)
+        self._wake.clear()
+
+    def run(self):
+        self._running = True
+        while self._running:
+            if self.paused:
+                self._wake.wait()
+                self._wake.clear()
+            elif self.video:
+                self.read_camera()
+            else:
+                self.read_still()
+        if self.camera is not None:
+            self.camera.release()
+
+
+class CaptureFrame(QtCore.QObject):
+    image_data = QtCore.pyqtSignal(np.ndarray)
+    fps_data = QtCore.pyqtSignal(float, float)
+
+    def __init__(self, camera_port=0, target_fps=30, parent=None):
+        super().__init__(parent)
+        self.target_fps = target_fps
+        self._last_emit = 0.0
+        self._emitted = collections.deque()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.deliver)
+        self.fps_timer = QtCore.QTimer(self)
+        self.fps_timer.setInterval(1000)
+        self.fps_timer.timeout.connect(self.report_fps)
+        self.frames = FrameQueue()
+        self.worker = CaptureWorker(self.frames, camera_port)
+        self.worker.frame_ready.connect(self.frame_arrived)
         self.start_recording()
 
+    @property
+    def video(self):
+        return self.worker.video
+
+    @video.setter
+    def video(self, value):
+        self.worker.video = value
+        self.worker.refresh()
+
+    @property
+    def image_path(self):
+        return self.worker.image_path
+
+    @image_path.setter
+    def image_path(self, value):
+        self.worker.image_path = value
+        self.worker.refresh()
+
+    @property
+    def process_size(self):
+        return self.worker.process_size
+
+    @process_size.setter
+    def process_size(self, value):
+        self.worker.process_size = value
+        self.worker.refresh()
+
     def start_recording(self):
-        self.timer.start(0, self)
+        self.worker.start()
 
-    def open_camera(self):
-        self.camera = cv2.VideoCapture(self.port)
+    def stop_recording(self):
+        self.timer.stop()
+        self.fps_timer.stop()
+        self.worker.stop()
+
+    def freeze(self, value):
+        self.worker.paused = value
+        self.worker.refresh()
+        if value:
+            self.timer.stop()
+            self.frames.clear()
+
+    def set_target_fps(self, value):
+        self.target_fps = max(1, value)
 
-    def timerEvent(self, event):
-        if event.timerId() != self.timer.timerId():
+    def frame_arrived(self):
+        if self.timer.isActive():
             return
-        if self.video:
-            if self.camera is None:
-                self.open_camera()
-            elif not self.camera.isOpened():
-                self.camera.open(self.port)
-            read, data = self.camera.read()
-            if read:
-                data = cv2.flip(data, 1)
+        delay = self._last_emit + 1.0 / self.target_fps - time.monotonic()
+        if delay > 0:
+            self.timer.start(int(delay * 1000) + 1)
         else:
-            if self.camera is not None:
-                if self.camera.isOpened():
-                    self.camera.release()
-            data = cv2.imread(self.image_path)
-            read = True
-        if read:
-            data = cv2.resize(data, (540, 340), interpolation=cv2.INTER_AREA)
-            self.image_data.emit(data)
+            self.deliver()
+
+    def deliver(self):
+        data = self.frames.get()
+        if data is None:
+            return
+        now = time.monotonic()
+        self._last_emit = now
+        self._emitted.append(now)
+        self.image_data.emit(data)
+        if not self.fps_timer.isActive():
+            self.fps_timer.start()
+        if len(self.frames):
+            self.frame_arrived()
+
+    def achieved_fps(self):
+        horizon = time.monotonic() - 1.0
+        while self._emitted and self._emitted[0] < horizon:
+            self._emitted.popleft()
+        return float(len(self._emitted))
+
+    def report_fps(self):
+        fps = self.achieved_fps()
+        self.fps_data.emit(fps, self.target_fps)
+        if fps == 0:
+            self.fps_timer.stop()
+
 
 class VideoStream(QtWidgets.QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, display_size=(540, 340)):
         super().__init__(parent)
         self.image = QtGui.QImage()
+        self.frame = None
+        self.pixmap = None
+        self._shown = False
+        self.setFixedSize(*display_size)
         self._red = (0, 0, 255)
         self._width = 2
         self._min_size = (30, 30)
 
-    def image_data_slot(self, image_data):
-        self.image = self.get_qimage(image_data)
-        if self.image.size() != self.size():
-            self.setFixedSize(self.image.size())
+    def set_frame(self, frame):
+        # The QImage borrows the array's memory, so keep the array alive for
+        # as long as the image is in use.
+        frame = np.ascontiguousarray(frame)
+        self.frame = frame
+        self.image = self.get_qimage(frame)
+        self.pixmap = None
+        self._shown = False
         self.update()
 
+    def image_data_slot(self, image_data):
+        self.set_frame(image_data)
+
     @staticmethod
     def get_qimage(image: np.ndarray):
-        height, width, colors = image.shape
-        bytesPerLine = 3 * width
         QImage = QtGui.QImage
-
+        height, width = image.shape[:2]
+        bytesPerLine = image.strides[0]
+        if image.ndim == 2:
+            return QImage(image.data, width, height, bytesPerLine,
+                          QImage.Format_Grayscale8)
+        if hasattr(QImage, 'Format_BGR888'):
+            return QImage(image.data, width, height, bytesPerLine,
+                          QImage.Format_BGR888)
         image = QImage(image.data,
                        width,
                        height,
                        bytesPerLine,
                        QImage.Format_RGB888)
+        return image.rgbSwapped()
 
-        image = image.rgbSwapped()
-        return image
+    def target_rect(self, size):
+        size = size.scaled(self.size(), QtCore.Qt.KeepAspectRatio)
+        rect = QtCore.QRect(QtCore.QPoint(0, 0), size)
+        rect.moveCenter(self.rect().center())
+        return rect
 
     def paintEvent(self, event):
+        # Repaints reuse the last frame, so the pane stays filled even when
+        # capture slows down, stalls or stops.
+        if self.image.isNull():
+            return
+        rect = self.target_rect(self.image.size())
         painter = QtGui.QPainter(self)
-        painter.drawImage(0, 0, self.image)
-        self.image = QtGui.QImage()
+        if not self._shown:
+            # A new frame is drawn straight from the borrowed image; only a
+            # frame painted again gets a scaled pixmap to repaint from.
+            self._shown = True
+            painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+            painter.drawImage(rect, self.image)
+            return
+        if self.pixmap is None or self.pixmap.size() != rect.size():
+            self.pixmap = QtGui.QPixmap.fromImage(self.image).scaled(
+                rect.size(), QtCore.Qt.IgnoreAspectRatio,
+                QtCore.Qt.SmoothTransformation)
+        painter.drawPixmap(rect, self.pixmap)
 
 
 class ColorDetector(VideoStream):
+    threshold_path = QtCore.pyqtSignal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.lowHue = 0
-        self.lowSat = 0
-        self.lowVal = 0
-        self.highHue = 359
-        self.highSat = 255
-        self.highVal = 255
-        self.erode = False
-        self.dilate = False
-        self.blur = False
-        self.invert = False
-        self.show = False
-        self.k_size = 11
-        self.erode_i = 1
-        self.dilate_i = 1
+        # The Hue sliders run over 0-359, so hues default to degrees.
+        self.params = MaskParams(hue_scale=360)
+        self._render_pending = False
+        self.engine = MaskEngine()
+        self.source = None
+        self.preview = False
+        self.preview_scale = 4
+        self.preview_engine = MaskEngine()
+        self._preview_source = (None, None)
+        # Colour classes tuned one at a time; params is the selected one.
+        self.classes = [self.params]
+        self.current = 0
+        self.show_labels = False
+        self.segment_engine = SegmentEngine()
+        self.preview_segment_engine = SegmentEngine()
+        self.palette = self.label_palette()
+        # Camera frames that look like the last masked one keep its mask.
+        self.gate = ChangeGate()
+        self.gating = False
+
+    def publish(self, params=None, **changes):
+        '''Swap in a new parameter snapshot and schedule one re-render.
+
+        Bursts of control changes within one event loop pass collapse into
+        a single render of the latest snapshot.
+        '''
+        if params is None:
+            params = self.params
+        self.params = params.replace(**changes)
+        self.classes[self.current] = self.params
+        if not self._render_pending:
+            self._render_pending = True
+            QtCore.QTimer.singleShot(0, self.rerender)
+
+    @staticmethod
+    def label_palette():
+        '''BGR colour of each label, black for the background.'''
+        hsv = np.full((1, 256, 3), 255, np.uint8)
+        hsv[0, :, 0] = np.arange(256) * 47 % 180
+        palette = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+        palette[0, 0] = 0
+        return palette
+
+    def add_class(self):
+        self.classes.append(self.params)
+        return len(self.classes) - 1
+
+    def select_class(self, index, **changes):
+        self.current = index
+        self.publish(self.classes[index], **changes)
+
+    def set_gating(self, value):
+        self.gating = value
+        self.gate.reset()
+
+    def set_change_threshold(self, value):
+        self.gate.threshold = value
+
+    def set_show_labels(self, value):
+        self.show_labels = value
+        self.publish()
+
+    def colour_labels(self, labels, pool):
+        image = pool.get('labels.bgr', labels.shape + (3,))
+        cv2.cvtColor(labels, cv2.COLOR_GRAY2BGR, dst=image)
+        return cv2.LUT(image, self.palette, dst=image)
+
+    def preview_frame(self, frame):
+        source, small = self._preview_source
+        if source is not frame:
+            height, width = frame.shape[:2]
+            scale = min(self.preview_scale, max(1, max(height, width) // 128))
+            small = cv2.resize(frame, (width // scale, height // scale),
+                               interpolation=cv2.INTER_AREA)
+            self._preview_source = (frame, small)
+        return small
 
     def mask_frame(self, frame):
-        image = frame.copy()
-        lower_range = (self.lowHue, self.lowSat, self.lowVal)
-        upper_range = (self.highHue, self.highSat, self.highVal)
-        if self.blur:
-            frame = cv2.GaussianBlur(frame, (self.k_size, self.k_size), 0)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(frame, lower_range, upper_range)
-
-        if self.erode:
-            mask = cv2.erode(mask, None, iterations=self.erode_i)
-        if self.dilate:
-            mask = cv2.dilate(mask, None, iterations=self.dilate_i)
-        if self.invert:
-            mask = 255 - mask
-        if not self.show:
-            mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2RGB)
-        if self.show:
-            mask_inv = cv2.bitwise_not(mask)
-            rows, cols, channels = image.shape
-            image = image[0:rows, 0:cols]
-            masked = cv2.bitwise_or(image, image, mask=mask)
-            masked = masked[0:rows, 0:cols]
-            not_masked = cv2.bitwise_or(mask, mask, mask=mask_inv)
-            not_masked = np.stack((not_masked,) * 3, axis=-1)
-            mask = masked + not_masked
-        return mask
+        # Frames handed over by CaptureFrame are never written to, so the
+        # engines may reuse their cached stages when the same frame comes
+        # back.
+        params, classes = self.params, self.classes
+        engine, segment = self.engine, self.segment_engine
+        if self.preview:
+            small = self.preview_frame(frame)
+            scale = frame.shape[1] // small.shape[1]
+            classes = [item.replace(k_size=max(1, (item.k_size // scale) | 1))
+                       for item in classes]
+            params = classes[self.current]
+            engine, segment = self.preview_engine, self.preview_segment_engine
+            frame = small
+        if self.show_labels:
+            labels = segment.segment(frame, classes, cached=True)
+            return self.colour_labels(labels, segment.pool)
+        return engine.process(frame, params, cached=True)
+
+    def start_preview(self, *args):
+        self.preview = True
+
+    def finish_preview(self):
+        if self.preview:
+            self.preview = False
+            self.rerender()
+
+    def render(self, frame):
+        self.set_frame(self.mask_frame(frame))
+        if self.show_labels:
+            self.threshold_path.emit('{} classes'.format(len(self.classes)))
+            return
+        engine = self.preview_engine if self.preview else self.engine
+        self.threshold_path.emit(engine.threshold_path)
 
     def image_data_slot(self, image_data):
-        mask = self.mask_frame(image_data)
-        self.image = self.get_qimage(mask)
-        if self.image.size() != self.size():
-            self.setFixedSize(self.image.size())
-        self.update()
+        # Setting changes go through rerender, so a skipped frame never
+        # leaves a mask made with old settings on screen.
+        if self.gating and not self.gate.changed(image_data):
+            return
+        self.source = image_data
+        self.render(image_data)
+
+    def rerender(self, *args):
+        self._render_pending = False
+        if self.source is not None:
+            self.render(self.source)
 
 
 class MainWidget(QtWidgets.QWidget):
+    RESOLUTIONS = (('Native', 0), ('1080p', 1920), ('720p', 1280),
+                   ('540 px', 540), ('360 px', 360), ('240 px', 240))
+    MORPH_OPS = (('No Morphology', 'none'), ('Open', 'open'),
+                 ('Close', 'close'), ('Gradient', 'gradient'),
+                 ('Top Hat', 'tophat'))
+    KERNEL_SHAPES = (('Rectangle', 'rect'), ('Ellipse', 'ellipse'),
+                     ('Cross', 'cross'))
+    HUE_SCALES = (('Hue 0-359', 360), ('Hue 0-179', 180))
+    BLUR_BACKENDS = (('Gaussian Blur', 'gaussian'), ('Box Blur', 'box'),
+                     ('Stack Blur', 'stack'), ('Pyramid Blur', 'pyramid'),
+                     ('Fastest Blur', 'auto'))
+    PREVIEW_IDLE_MS = 150
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.line_num = 0
         self.video_stream = VideoStream()
         self.color_detector = ColorDetector()
         self.about_window = AboutWindow()
@@ -244,6 +568,23 @@ class MainWidget(QtWidgets.QWidget):
         self.dilate_spinbox = box.findChild(QtWidgets.QSpinBox, 'spinBox_dilate')
         self.dilate_spinbox.valueChanged.connect(self.spinbox_dilate)
 
+        # While an HSV slider is dragged the mask is drawn from a decimated
+        # frame; the full-resolution pass follows on release or once the
+        # slider has been still for PREVIEW_IDLE_MS. Values set from code,
+        # as when loading a config, go straight to the full pass.
+        self.preview_timer = QtCore.QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_IDLE_MS)
+        self.preview_timer.timeout.connect(self.color_detector.finish_preview)
+        for slider in (self.lh, self.hh, self.ls, self.hs, self.lv, self.hv):
+            slider.sliderPressed.connect(self.color_detector.start_preview)
+            slider.sliderMoved.connect(self.color_detector.start_preview)
+            # sliderMoved(int) would pick the start(msec) overload and turn
+            # the slider value into the idle interval.
+            slider.sliderMoved.connect(lambda _: self.preview_timer.start())
+            slider.sliderReleased.connect(self.preview_timer.stop)
+            slider.sliderReleased.connect(self.color_detector.finish_preview)
+
         box.move(100, 100)
         options_layout = QtWidgets.QHBoxLayout()
         options_layout.addWidget(box)
@@ -257,6 +598,11 @@ class MainWidget(QtWidgets.QWidget):
         video_button.move(100, 100)
         video_button.clicked.connect(self.video_click)
 
+        self.freeze_button = QtWidgets.QPushButton('Freeze', self)
+        self.freeze_button.setToolTip('Freeze Current Frame')
+        self.freeze_button.setCheckable(True)
+        self.freeze_button.toggled.connect(self.capture_frame.freeze)
+
         image_button = QtWidgets.QPushButton('Open Image', self)
         image_button.setToolTip('Open an Image')
         image_button.move(100, 100)
@@ -267,12 +613,148 @@ class MainWidget(QtWidgets.QWidget):
         about_button.move(100, 150)
         about_button.clicked.connect(self.about_click)
 
+        gate_check = QtWidgets.QCheckBox('Skip Still Frames', self)
+        gate_check.setToolTip('Keep the Mask While the Scene Is Unchanged')
+        gate_check.clicked.connect(self.color_detector.set_gating)
+
+        gate_spinbox = QtWidgets.QSpinBox(self)
+        gate_spinbox.setToolTip('Grey Levels a Frame Must Change By')
+        gate_spinbox.setRange(1, 64)
+        gate_spinbox.setPrefix('Change > ')
+        gate_spinbox.setValue(self.color_detector.gate.threshold)
+        gate_spinbox.valueChanged.connect(
+            self.color_detector.set_change_threshold)
+
         buttons_layout.addWidget(video_button)
+        buttons_layout.addWidget(self.freeze_button)
+        buttons_layout.addWidget(gate_check)
+        buttons_layout.addWidget(gate_spinbox)
         buttons_layout.addWidget(image_button)
         buttons_layout.addWidget(about_button)
 
+        fps_spinbox = QtWidgets.QSpinBox(self)
+        fps_spinbox.setToolTip('Target Frame Rate')
+        fps_spinbox.setRange(1, 120)
+        fps_spinbox.setSuffix(' fps')
+        fps_spinbox.setValue(self.capture_frame.target_fps)
+        fps_spinbox.valueChanged.connect(self.capture_frame.set_target_fps)
+        self.fps_label = QtWidgets.QLabel('0.0 / {} fps'.format(
+            self.capture_frame.target_fps))
+        self.capture_frame.fps_data.connect(self.fps_update)
+
+        resolution_box = QtWidgets.QComboBox(self)
+        resolution_box.setToolTip('Processing Resolution')
+        for text, value in self.RESOLUTIONS:
+            resolution_box.addItem(text, value)
+        resolution_box.setCurrentIndex(resolution_box.findData(
+            self.capture_frame.process_size))
+        resolution_box.currentIndexChanged.connect(
+            lambda index: self.resolution_select(resolution_box.itemData(index)))
+
+        overlay_box = QtWidgets.QComboBox(self)
+        overlay_box.setToolTip('Masked Image Style')
+        overlay_box.addItem('Masked', 'masked')
+        overlay_box.addItem('Tint', 'tint')
+        overlay_box.addItem('Outline', 'outline')
+        overlay_box.currentIndexChanged.connect(
+            lambda index: self.overlay_select(overlay_box.itemData(index)))
+
+        colour_button = QtWidgets.QPushButton('Overlay Colour', self)
+        colour_button.setToolTip('Background, Tint or Outline Colour')
+        colour_button.clicked.connect(self.colour_click)
+
         layout.addLayout(buttons_layout)
 
+        self.wrap_check = QtWidgets.QCheckBox('Wrap Hue', self)
+        self.wrap_check.setToolTip('Low Hue above High Hue wraps around 0')
+        self.wrap_check.clicked.connect(self.wrap_check_click)
+
+        self.hue_scale_box = QtWidgets.QComboBox(self)
+        self.hue_scale_box.setToolTip('Hue Scale of the Hue Sliders')
+        for text, value in self.HUE_SCALES:
+            self.hue_scale_box.addItem(text, value)
+        self.hue_scale_box.setCurrentIndex(self.hue_scale_box.findData(
+            self.color_detector.params.hue_scale))
+        self.hue_scale_box.currentIndexChanged.connect(self.hue_scale_select)
+
+        settings_layout = QtWidgets.QHBoxLayout()
+        settings_layout.addWidget(self.wrap_check)
+        settings_layout.addWidget(self.hue_scale_box)
+        settings_layout.addWidget(resolution_box)
+        settings_layout.addWidget(overlay_box)
+        settings_layout.addWidget(colour_button)
+        settings_layout.addWidget(fps_spinbox)
+        settings_layout.addWidget(self.fps_label)
+
+        self.path_label = QtWidgets.QLabel('', self)
+        self.path_label.setToolTip('Threshold Path')
+        self.color_detector.threshold_path.connect(self.path_label.setText)
+        settings_layout.addWidget(self.path_label)
+
+        layout.addLayout(settings_layout)
+
+        self.morph_box = QtWidgets.QComboBox(self)
+        self.morph_box.setToolTip('Morphology Operation')
+        for text, value in self.MORPH_OPS:
+            self.morph_box.addItem(text, value)
+        self.morph_box.currentIndexChanged.connect(self.morph_select)
+
+        self.morph_spinbox = QtWidgets.QSpinBox(self)
+        self.morph_spinbox.setToolTip('Morphology Iterations')
+        self.morph_spinbox.setRange(1, 20)
+        self.morph_spinbox.setSuffix(' times')
+        self.morph_spinbox.valueChanged.connect(self.spinbox_morph)
+
+        self.shape_box = QtWidgets.QComboBox(self)
+        self.shape_box.setToolTip('Morphology Kernel Shape')
+        for text, value in self.KERNEL_SHAPES:
+            self.shape_box.addItem(text, value)
+        self.shape_box.currentIndexChanged.connect(self.shape_select)
+
+        self.kernel_spinbox = QtWidgets.QSpinBox(self)
+        self.kernel_spinbox.setToolTip('Morphology Kernel Size')
+        self.kernel_spinbox.setRange(1, 31)
+        self.kernel_spinbox.setSingleStep(2)
+        self.kernel_spinbox.setValue(self.color_detector.params.kernel_size)
+        self.kernel_spinbox.setPrefix('Kernel ')
+        self.kernel_spinbox.valueChanged.connect(self.spinbox_kernel)
+
+        self.blur_box = QtWidgets.QComboBox(self)
+        self.blur_box.setToolTip('Blur Backend')
+        for text, value in self.BLUR_BACKENDS:
+            if value == 'auto' or value in BLURS:
+                self.blur_box.addItem(text, value)
+        self.blur_box.currentIndexChanged.connect(self.blur_select)
+
+        morph_layout = QtWidgets.QHBoxLayout()
+        morph_layout.addWidget(self.blur_box)
+        morph_layout.addWidget(self.morph_box)
+        morph_layout.addWidget(self.morph_spinbox)
+        morph_layout.addWidget(self.shape_box)
+        morph_layout.addWidget(self.kernel_spinbox)
+
+        layout.addLayout(morph_layout)
+
+        self.class_box = QtWidgets.QComboBox(self)
+        self.class_box.setToolTip('Colour Class Being Tuned')
+        self.class_box.addItem('Class 1')
+        self.class_box.currentIndexChanged.connect(self.class_select)
+
+        add_class_button = QtWidgets.QPushButton('Add Class', self)
+        add_class_button.setToolTip('New Class Starting From This One')
+        add_class_button.clicked.connect(self.add_class_click)
+
+        labels_check = QtWidgets.QCheckBox('Show Labels', self)
+        labels_check.setToolTip('Show Every Class, One Colour Each')
+        labels_check.clicked.connect(self.color_detector.set_show_labels)
+
+        class_layout = QtWidgets.QHBoxLayout()
+        class_layout.addWidget(self.class_box)
+        class_layout.addWidget(add_class_button)
+        class_layout.addWidget(labels_check)
+
+        layout.addLayout(class_layout)
+
         csv_layout = QtWidgets.QHBoxLayout()
         
         start_button = QtWidgets.QPushButton('SAVE Configurations', self)
@@ -292,52 +774,105 @@ class MainWidget(QtWidgets.QWidget):
         
         self.setLayout(layout)
 
+    def set_bound(self, which, channel, value):
+        bound = list(getattr(self.color_detector.params, which))
+        bound[channel] = value
+        self.color_detector.publish(**{which: tuple(bound)})
+
     def low_hue(self, value):
-        self.color_detector.lowHue = value
+        self.set_bound('lower_range', 0, value)
 
     def high_hue(self, value):
-        self.color_detector.highHue = value
+        self.set_bound('upper_range', 0, value)
 
     def low_sat(self, value):
-        self.color_detector.lowSat = value
+        self.set_bound('lower_range', 1, value)
 
     def high_sat(self, value):
-        self.color_detector.highSat = value
+        self.set_bound('upper_range', 1, value)
 
     def low_val(self, value):
-        self.color_detector.lowVal = value
+        self.set_bound('lower_range', 2, value)
 
     def high_val(self, value):
-        self.color_detector.highVal = value
+        self.set_bound('upper_range', 2, value)
+
+    def wrap_check_click(self, value):
+        self.color_detector.publish(hue_wrap=value)
+
+    def publish_choice(self, box, field, index):
+        # findData gives -1 for a value the box does not offer.
+        if index >= 0:
+            self.color_detector.publish(**{field: box.itemData(index)})
+
+    def hue_scale_select(self, index):
+        self.publish_choice(self.hue_scale_box, 'hue_scale', index)
 
     def blur_check(self, value):
-        self.color_detector.blur = value
+        self.color_detector.publish(blur=value)
 
     def ksize_val(self, value):
         if value % 2 == 0:
             value = value + 1
             self.k_size.setValue(value)
-        self.color_detector.k_size = value
+        self.color_detector.publish(k_size=value)
 
     def invert_check(self, value):
-        self.color_detector.invert = value
+        self.color_detector.publish(invert=value)
 
     def erode_check(self, value):
-        self.color_detector.erode = value
+        self.color_detector.publish(erode=value)
 
     def dilate_check(self, value):
-        self.color_detector.dilate = value
+        self.color_detector.publish(dilate=value)
 
     def spinbox_dilate(self, value):
-        self.color_detector.dilate_i = value
+        self.color_detector.publish(dilate_i=value)
 
     def spinbox_erode(self, value):
-        self.color_detector.erode_i = value
+        self.color_detector.publish(erode_i=value)
+
+    def blur_select(self, index):
+        self.publish_choice(self.blur_box, 'blur_backend', index)
+
+    def morph_select(self, index):
+        self.publish_choice(self.morph_box, 'morph', index)
+
+    def spinbox_morph(self, value):
+        self.color_detector.publish(morph_i=value)
+
+    def shape_select(self, index):
+        self.publish_choice(self.shape_box, 'kernel_shape', index)
+
+    def spinbox_kernel(self, value):
+        if value % 2 == 0:
+            value = value + 1
+            self.kernel_spinbox.setValue(value)
+        self.color_detector.publish(kernel_size=value)
 
     def showmask_check(self, value):
-        self.color_detector.show = value
+        self.color_detector.publish(show=value)
+
+    def fps_update(self, achieved, target):
+        self.fps_label.setText('{:.1f} / {:.0f} fps'.format(achieved, target))
+
+    def overlay_select(self, value):
+        self.color_detector.publish(overlay=value)
+
+    def colour_click(self):
+        blue, green, red = self.color_detector.params.overlay_colour
+        colour = QtWidgets.QColorDialog.getColor(
+            QtGui.QColor(red, green, blue), self, 'Overlay Colour')
+        if colour.isValid():
+            self.color_detector.publish(overlay_colour=(colour.blue(),
+                                                        colour.green(),
+                                                        colour.red()))
+
+    def resolution_select(self, value):
+        self.capture_frame.process_size = value
 
     def video_click(self):
+        self.freeze_button.setChecked(False)
         self.capture_frame.video = True
 
     def about_click(self):
@@ -346,78 +881,66 @@ class MainWidget(QtWidgets.QWidget):
     def image_click(self):
         filename = self.openFileNameDialog()
         if filename:
+            self.freeze_button.setChecked(False)
             self.capture_frame.image_path = filename
             self.capture_frame.video = False
 
+    def class_select(self, index):
+        if index < 0:
+            return
+        # Backend and overlay are settings of the view, not of a class.
+        current = self.color_detector.params
+        self.color_detector.select_class(
+            index, backend=current.backend, overlay=current.overlay,
+            overlay_colour=current.overlay_colour)
+        self.show_params(self.color_detector.params)
+
+    def add_class_click(self):
+        index = self.color_detector.add_class()
+        self.class_box.addItem('Class {}'.format(index + 1))
+        self.class_box.setCurrentIndex(index)
+
+    def show_params(self, params):
+        self.lh.setValue(params.lower_range[0])
+        self.hh.setValue(params.upper_range[0])
+        self.ls.setValue(params.lower_range[1])
+        self.hs.setValue(params.upper_range[1])
+        self.lv.setValue(params.lower_range[2])
+        self.hv.setValue(params.upper_range[2])
+        self.wrap_check.setChecked(params.hue_wrap)
+        self.hue_scale_box.setCurrentIndex(
+            self.hue_scale_box.findData(params.hue_scale))
+        self.blur.setChecked(params.blur)
+        self.k_size.setValue(params.k_size)
+        self.blur_box.setCurrentIndex(
+            self.blur_box.findData(params.blur_backend))
+        self.erode.setChecked(params.erode)
+        self.erode_spinbox.setValue(params.erode_i)
+        self.dilate.setChecked(params.dilate)
+        self.dilate_spinbox.setValue(params.dilate_i)
+        self.invert.setChecked(params.invert)
+        self.show_mask.setChecked(params.show)
+        self.morph_box.setCurrentIndex(self.morph_box.findData(params.morph))
+        self.morph_spinbox.setValue(params.morph_i)
+        self.shape_box.setCurrentIndex(
+            self.shape_box.findData(params.kernel_shape))
+        self.kernel_spinbox.setValue(params.kernel_size)
+
     def save_click(self):
         filename = self.saveFileDialog()
         if filename:
-            with open(filename, 'w', newline='') as file:
-                writer = csv.writer(file)
-                self.line_num = 0
-                writer.writerow(["SN", "Name", "Value"])
-                writer.writerow([self.line_print(), "Low Hue",
-                                 self.color_detector.lowHue])
-                writer.writerow([self.line_print(), "High Hue",
-                                 self.color_detector.highHue])
-                writer.writerow(
-                    [self.line_print(), "Low Saturation", self.color_detector.lowSat])
-                writer.writerow(
-                    [self.line_print(), "High Saturation", self.color_detector.highSat])
-                writer.writerow(
-                    [self.line_print(), "Low Value", self.color_detector.lowVal])
-                writer.writerow(
-                    [self.line_print(), "High Value", self.color_detector.highVal])
-                writer.writerow(
-                    [self.line_print(), "Gaussian Blur", self.color_detector.blur])
-                
-                writer.writerow([self.line_print(), "Kernel Size",
-                                    str(self.color_detector.k_size) + 'x' + str(self.color_detector.k_size)])
-                writer.writerow(
-                    [self.line_print(), "Remove Erodes", self.color_detector.erode])
-                
-                writer.writerow(
-                    [self.line_print(), "Remove Erodes Iterations", self.color_detector.erode_i])
-                writer.writerow(
-                    [self.line_print(), "Dilate Mask", self.color_detector.dilate])
-
-                writer.writerow(
-                    [self.line_print(), "Dilate Iterations", self.color_detector.dilate_i])
-                writer.writerow(
-                    [self.line_print(), "Invert Mask", self.color_detector.invert])
-                writer.writerow(
-                    [self.line_print(), "Show Masked Image", self.color_detector.show])
+            write_config(filename, self.color_detector.params)
 
     def load_click(self):
         filename = self.loadFileDialog()
-        names = ["SN", "Name", "Value"]
         if filename:
-            with open(filename, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                value = []
-                for row in reader:
-                    value.append(row[names[2]])
-                self.lh.setValue(int(value[0]))
-                self.hh.setValue(int(value[1]))
-                self.ls.setValue(int(value[2]))
-                self.hs.setValue(int(value[3]))
-                self.lv.setValue(int(value[4]))
-                self.hv.setValue(int(value[5]))
-                self.blur.setChecked(value[6].lower() in ['true', '1'])
-                self.color_detector.blur = (value[6].lower() in ['true', '1'])
-                self.k_size.setValue(int(value[7].split('x')[0]))
-                self.erode.setChecked(value[8].lower() in ['true', '1'])
-                self.color_detector.erode = (value[8].lower() in ['true', '1'])
-                self.erode_spinbox.setValue(int(value[9]))
-                self.dilate.setChecked(value[10].lower() in ['true', '1'])
-                self.color_detector.dilate = (value[10].lower() in ['true', '1'])
-                self.dilate_spinbox.setValue(int(value[11]))
-                self.invert.setChecked(value[12].lower() in ['true', '1'])
-                self.color_detector.invert = (value[12].lower() in ['true', '1'])
-                self.show_mask.setChecked(value[13].lower() in ['true', '1'])
-                self.color_detector.show = (value[13].lower() in ['true', '1'])
-        else:
-            obj.setCheckable()
+            params = read_config(filename)
+            self.show_params(params)
+            current = self.color_detector.params
+            self.color_detector.publish(params.replace(
+                backend=current.backend, overlay=current.overlay,
+                overlay_colour=current.overlay_colour))
+
     def saveFileDialog(self):
         options = QFileDialog.Options()
         options |= QFileDialog.DontUseNativeDialog
@@ -443,24 +966,21 @@ class MainWidget(QtWidgets.QWidget):
         if file_name:
             return file_name
 
-    def line_print(self):
-        self.line_num += 1
-        return self.line_num
-
 
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
     window = QtWidgets.QMainWindow()
     window.setStyleSheet(open("layouts/style.qss").read())
     # window.setWindowState(QtCore.Qt.WindowMaximized)
-    window.setFixedSize(1104,614)
-    qtRectangle = window.frameGeometry()
-    centerPoint = QtWidgets.QDesktopWidget().availableGeometry().center()
-    qtRectangle.moveCenter(centerPoint)
-    window.move(qtRectangle.topLeft())
     window.setWindowIcon(QtGui.QIcon('images/icon.png'))
     widget = MainWidget()
     window.setWindowTitle("Color Mask Range Detector")
     window.setCentralWidget(widget)
+    window.setFixedSize(window.sizeHint())
+    qtRectangle = window.frameGeometry()
+    centerPoint = QtWidgets.QDesktopWidget().availableGeometry().center()
+    qtRectangle.moveCenter(centerPoint)
+    window.move(qtRectangle.topLeft())
     window.show()
+    app.aboutToQuit.connect(widget.capture_frame.stop_recording)
     sys.exit(app.exec_())